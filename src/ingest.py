@@ -5,53 +5,111 @@ Loads documents from various sources using Agno's built-in Knowledge classes.
 """
 
 import argparse
+import hashlib
 import os
-import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, List, Optional, Tuple
 
-from agno.embedder.google import GeminiEmbedder
+from agno.document.reader.text_reader import TextReader
+from agno.knowledge.agent import AgentKnowledge
 from agno.knowledge.csv import CSVKnowledgeBase
-from agno.knowledge.document import DocumentKnowledgeBase
+from agno.knowledge.text import TextKnowledgeBase
 from agno.vectordb.pgvector import PgVector
 from dotenv import load_dotenv
 
+from utils.chunking import SentenceBoundaryChunking
+from utils.database import (
+    clear_ingested_hashes,
+    copy_upsert_documents,
+    count_documents,
+    create_db_engine,
+    deferred_vector_index,
+    get_ingested_hash,
+    record_ingested_hash,
+)
+from utils.embedder import BatchingGeminiEmbedder, get_embedder
+from utils.log import flush_logger, get_logger
+
 # Load environment variables
 load_dotenv()
 
+CHUNK_SIZE = 1000  # チャンクの最大文字数
+MAX_INGEST_WORKERS = 4  # 同時に取り込むファイル数の上限
+
+logger = get_logger("ingest")
+
 
 def setup_vector_db():
     """Setup pgvector database using Agno."""
     vector_db = PgVector(
         table_name=os.getenv("TABLE_NAME", "documents"),
         db_url=os.getenv("DATABASE_URL"),
-        embedder=GeminiEmbedder(),  # or use the appropriate embeddings class
+        db_engine=create_db_engine(os.getenv("DATABASE_URL")),
+        embedder=get_embedder(),  # or use the appropriate embeddings class
     )
     return vector_db
 
 
+def upsert_knowledge(knowledge: AgentKnowledge, vector_db: PgVector) -> int:
+    """Embed each document list in batches and bulk-upsert it into the vector database."""
+    if not vector_db.exists():
+        vector_db.create()
+
+    embedder = vector_db.embedder
+    num_documents = 0
+    for documents in knowledge.document_lists:
+        if not isinstance(embedder, BatchingGeminiEmbedder):
+            num_documents += copy_upsert_documents(vector_db, documents)
+            continue
+        # Embed the whole list up front so the upsert does not call Gemini per chunk
+        texts = [doc.content for doc in documents]
+        try:
+            embedder.prefetch(texts)
+            num_documents += copy_upsert_documents(vector_db, documents)
+        finally:
+            embedder.discard(texts)
+    return num_documents
+
+
+def is_empty_file(file_path: str) -> bool:
+    """Return True for a regular file with no contents."""
+    return os.path.isfile(file_path) and os.path.getsize(file_path) == 0
+
+
 def load_text_knowledge(file_path: str, vector_db: PgVector):
-    """Load text file knowledge using Agno's DocumentKnowledgeBase."""
-    print(f"テキストファイルを処理中: {file_path}")
+    """Load text file knowledge using Agno's TextKnowledgeBase."""
+    logger.info("テキストファイルを処理中: %s", file_path)
 
     try:
-        # Create DocumentKnowledgeBase instance
-        text_knowledge = DocumentKnowledgeBase(
+        # Create TextKnowledgeBase instance
+        text_knowledge = TextKnowledgeBase(
             path=file_path,
             vector_db=vector_db,
+            reader=TextReader(
+                chunking_strategy=SentenceBoundaryChunking(
+                    embedder=get_embedder(), chunk_size=CHUNK_SIZE
+                )
+            ),
         )
 
         # Load the knowledge into vector database
-        text_knowledge.load(upsert=True)
-        print(f"テキストファイルの処理が完了しました: {file_path}")
+        # Readers log and swallow their own errors, so an empty result means failure
+        if not upsert_knowledge(text_knowledge, vector_db) and not is_empty_file(
+            file_path
+        ):
+            raise ValueError("ドキュメントを1件も読み込めませんでした")
+        logger.info("テキストファイルの処理が完了しました: %s", file_path)
         return True
     except Exception as e:
-        print(f"テキストファイルの処理中にエラーが発生しました: {file_path}")
-        print(f"エラー詳細: {e}")
+        logger.error("テキストファイルの処理中にエラーが発生しました: %s", file_path)
+        logger.error("エラー詳細: %s", e)
         return False
 
 
 def load_csv_knowledge(file_path: str, vector_db: PgVector):
     """Load CSV knowledge using Agno's CSVKnowledge."""
-    print(f"CSVファイルを処理中: {file_path}")
+    logger.info("CSVファイルを処理中: %s", file_path)
 
     try:
         # Create CSV knowledge instance
@@ -61,20 +119,115 @@ def load_csv_knowledge(file_path: str, vector_db: PgVector):
         )
 
         # Load the knowledge into vector database
-        csv_knowledge.load(upsert=True)
-        print(f"CSVファイルの処理が完了しました: {file_path}")
+        # Readers log and swallow their own errors, so an empty result means failure
+        if not upsert_knowledge(csv_knowledge, vector_db) and not is_empty_file(
+            file_path
+        ):
+            raise ValueError("ドキュメントを1件も読み込めませんでした")
+        logger.info("CSVファイルの処理が完了しました: %s", file_path)
         return True
     except Exception as e:
-        print(f"CSVファイルの処理中にエラーが発生しました: {file_path}")
-        print(f"エラー詳細: {e}")
+        logger.error("CSVファイルの処理中にエラーが発生しました: %s", file_path)
+        logger.error("エラー詳細: %s", e)
+        return False
+
+
+def file_sha256(file_path: str) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    with open(file_path, "rb") as file:
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+
+            return hashlib.file_digest(file, "sha256").hexdigest()
+        digest = hashlib.sha256()
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+        return digest.hexdigest()
+
+
+def is_unchanged(vector_db: PgVector, path_key: str, sha256: Optional[str]) -> bool:
+    """Return True if the file was already ingested with the same contents."""
+    if sha256 is None:
+        return False
+    try:
+        return vector_db.exists() and get_ingested_hash(vector_db, path_key) == sha256
+    except Exception as e:
+        # 履歴を確認できない場合は取り込み直す
+        logger.warning("取り込み履歴の確認に失敗しました: %s", e)
         return False
 
 
+def ingest_files(
+    vector_db: PgVector,
+    jobs: List[Tuple[Callable[[str, PgVector], bool], str]],
+    force: bool = False,
+    rebuild_index: bool = False,
+) -> int:
+    """Run (loader, file path) jobs, skipping files unchanged since the last ingest.
+
+    With rebuild_index, the table's vector indexes are dropped during the load
+    and rebuilt once afterwards. Returns the number of files that were loaded
+    or skipped successfully.
+    """
+    success_count = 0
+    pending = []
+    for load, file_path in jobs:
+        if not os.path.exists(file_path):
+            logger.warning("ファイルが見つかりません: %s", file_path)
+            continue
+
+        path_key = os.path.realpath(file_path)
+        # Directories are always loaded; only single files are hashed
+        sha256 = file_sha256(file_path) if os.path.isfile(file_path) else None
+        if not force and is_unchanged(vector_db, path_key, sha256):
+            logger.info("変更がないためスキップしました: %s", file_path)
+            success_count += 1
+        else:
+            pending.append((load, file_path, path_key, sha256))
+
+    if not pending:
+        flush_logger(logger)
+        return success_count
+
+    # Create the table up front so concurrent loaders do not race to create it
+    try:
+        if not vector_db.exists():
+            vector_db.create()
+    except Exception as e:
+        # 作成に失敗した場合は各ローダーがエラーを報告する
+        logger.error("テーブルの作成に失敗しました: %s", e)
+
+    # 大量取り込みでは、インデックスを外して最後に一度だけ再作成する
+    with deferred_vector_index(vector_db) if rebuild_index else nullcontext():
+        # Files load concurrently; the shared embedder rate-limits Gemini calls
+        workers = min(len(pending), MAX_INGEST_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(load, file_path, vector_db)
+                for load, file_path, _, _ in pending
+            ]
+            loaded = [future.result() for future in futures]
+
+    for (_, file_path, path_key, sha256), ok in zip(pending, loaded):
+        if not ok:
+            continue
+        success_count += 1
+        if sha256 is None:
+            continue
+        try:
+            record_ingested_hash(vector_db, path_key, sha256)
+        except Exception as e:
+            # 取り込み自体は成功しているので、次回は再取り込みされるだけで済む
+            logger.warning("取り込み履歴の記録に失敗しました: %s: %s", file_path, e)
+    # 取り込みの区切りでまとめて出力する
+    flush_logger(logger)
+    return success_count
+
+
 def clear_vector_db(vector_db: PgVector):
     """Clear all documents from the vector database."""
     print("データベースをクリアします...")
     try:
         vector_db.delete()
+        clear_ingested_hashes(vector_db)
         print("データベースのクリアが完了しました。")
         return True
     except Exception as e:
@@ -84,9 +237,8 @@ def clear_vector_db(vector_db: PgVector):
 
 def get_document_count(vector_db: PgVector) -> int:
     """Get the total number of documents in the vector database."""
-    # Note: This method may need adjustment based on Agno API
     try:
-        return len(vector_db.search("", limit=1000000))  # Rough count
+        return count_documents(vector_db)
     except Exception as e:
         print(f"Error getting document count: {e}")
         return 0
@@ -99,6 +251,14 @@ def main():
 
     parser.add_argument("--all", action="store_true", help="Ingest all sample data")
     parser.add_argument("--clear", action="store_true", help="Clear database")
+    parser.add_argument(
+        "--force", action="store_true", help="Re-ingest files even if unchanged"
+    )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="Drop vector indexes during the load and rebuild them afterwards",
+    )
 
     args = parser.parse_args()
 
@@ -111,29 +271,27 @@ def main():
         return
 
     if args.all:
-        success_count = 0
-        total_operations = 0
+        jobs = []
 
         # Load CSV knowledge
         csv_path = "data/sample.csv"
         if os.path.exists(csv_path):
-            total_operations += 1
-            if load_csv_knowledge(csv_path, vector_db):
-                success_count += 1
+            jobs.append((load_csv_knowledge, csv_path))
         else:
             print(f"CSVファイルが見つかりません: {csv_path}")
 
-        time.sleep(10)
-
         # Load text knowledge
         text_path = "data/sample.txt"
         if os.path.exists(text_path):
-            total_operations += 1
-            if load_text_knowledge(text_path, vector_db):
-                success_count += 1
+            jobs.append((load_text_knowledge, text_path))
         else:
             print(f"テキストファイルが見つかりません: {text_path}")
 
+        total_operations = len(jobs)
+        success_count = ingest_files(
+            vector_db, jobs, force=args.force, rebuild_index=args.rebuild_index
+        )
+
         # Show summary
         print("\n=== 処理結果サマリー ===")
         print(f"成功: {success_count}/{total_operations} 件")
@@ -145,10 +303,20 @@ def main():
         print(f"データベース内ドキュメント数: {total_docs} 件")
 
     elif args.csv:
-        load_csv_knowledge(args.csv, vector_db)
+        ingest_files(
+            vector_db,
+            [(load_csv_knowledge, args.csv)],
+            force=args.force,
+            rebuild_index=args.rebuild_index,
+        )
 
     elif args.text:
-        load_text_knowledge(args.text, vector_db)
+        ingest_files(
+            vector_db,
+            [(load_text_knowledge, args.text)],
+            force=args.force,
+            rebuild_index=args.rebuild_index,
+        )
 
     else:
         print("使用方法:")
@@ -160,6 +328,10 @@ def main():
             "  python ingest.py --text FILE              # テキストファイルを取り込み"
         )
         print("  python ingest.py --clear                  # データベースクリア")
+        print("  python ingest.py --all --force            # 変更がなくても再取り込み")
+        print(
+            "  python ingest.py --all --rebuild-index    # インデックスを最後に再作成"
+        )
 
 
 if __name__ == "__main__":
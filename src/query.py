@@ -5,58 +5,112 @@ Performs vector search on ingested documents using questions from CSV file.
 """
 
 import argparse
+import asyncio
 import csv
 import os
-import time
-from typing import List
+from collections import deque
+from typing import Deque, Iterable, Iterator, List, Tuple
 
-from agno.embedder.google import GeminiEmbedder
 from agno.vectordb.pgvector import PgVector
 from dotenv import load_dotenv
+from prompt_toolkit import PromptSession
+from sqlalchemy import text
+
+from utils.cache import SemanticCache
+from utils.database import (
+    count_documents,
+    create_db_engine,
+    search_by_embedding,
+)
+from utils.embedder import BatchingGeminiEmbedder, get_embedder
+from utils.log import flush_logger, get_logger
 
 # Load environment variables
 load_dotenv()
 
+# Maximum number of questions searched at the same time
+MAX_CONCURRENT_QUERIES = 16
+# Questions at least this similar (cosine) share cached search results
+SEMANTIC_CACHE_THRESHOLD = 0.95
+# Characters of each retrieved document shown in the results
+PREVIEW_CHARS = 200
+# HNSW candidate list size (hnsw.ef_search): larger is slower but finds
+# closer matches. Batch queries keep PgVector's own default of 5 (not
+# pgvector's server default of 40); interactive ones trade latency for recall.
+FAST_EF_SEARCH = 5
+RECALL_EF_SEARCH = 100
+# Seconds at the interactive prompt before idle connections are warmed again
+WARM_UP_IDLE_SECONDS = 60
+
+search_cache = SemanticCache(threshold=SEMANTIC_CACHE_THRESHOLD)
+logger = get_logger("query")
+
 
 def setup_vector_db():
     """Setup pgvector database using Agno."""
     vector_db = PgVector(
         table_name=os.getenv("TABLE_NAME", "documents"),
         db_url=os.getenv("DATABASE_URL"),
-        embedder=GeminiEmbedder(),
+        db_engine=create_db_engine(os.getenv("DATABASE_URL")),
+        embedder=get_embedder(),
     )
     return vector_db
 
 
-def read_questions_from_csv(file_path: str) -> List[str]:
-    """Read questions from CSV file."""
-    questions = []
+def iter_questions(file_path: str) -> Iterator[str]:
+    """Yield non-empty questions from CSV file as they are read."""
     try:
         with open(file_path, "r", encoding="utf-8") as file:
-            csv_reader = csv.DictReader(file)
+            csv_reader = csv.reader(file)
+            header = next(csv_reader, [])
+            if "question" not in header:
+                logger.error("エラー: question列が見つかりません: %s", file_path)
+                return
+            # 列位置はヘッダーから一度だけ求める
+            column = header.index("question")
             for row in csv_reader:
-                if "question" in row:
-                    questions.append(row["question"].strip())
-        return questions
+                if len(row) > column:
+                    question = row[column].strip()
+                    if question:
+                        yield question
     except FileNotFoundError:
-        print(f"エラー: ファイルが見つかりません: {file_path}")
-        return []
+        logger.error("エラー: ファイルが見つかりません: %s", file_path)
     except Exception as e:
-        print(f"CSVファイル読み込みエラー: {e}")
-        return []
+        logger.error("CSVファイル読み込みエラー: %s", e)
 
 
-def perform_search(vector_db: PgVector, query: str, limit: int = 1):
-    """Perform vector search and return results."""
+def perform_search(
+    vector_db: PgVector,
+    query: str,
+    limit: int = 1,
+    ef_search: int = FAST_EF_SEARCH,
+) -> List[str]:
+    """Perform vector search and return the contents of the matching documents."""
     try:
-        results = vector_db.search(query=query, limit=limit)
-        return results
+        embedding = vector_db.embedder.get_embedding(query)
+        if not embedding:
+            return []
+
+        # 類似した質問の検索結果がキャッシュにあれば再利用する
+        contents = search_cache.lookup(embedding, limit)
+        if contents is None:
+            # 表示に必要な先頭部分だけを取得する（1文字多く取り、省略の有無を判定する）
+            documents = search_by_embedding(
+                vector_db,
+                embedding,
+                limit,
+                preview_chars=PREVIEW_CHARS + 1,
+                ef_search=ef_search,
+            )
+            contents = [doc.content for doc in documents]
+            search_cache.add(embedding, limit, contents)
+        return contents
     except Exception as e:
-        print(f"検索エラー: {e}")
+        logger.error("検索エラー: %s", e)
         return []
 
 
-def format_search_results(query: str, results: List, query_index: int = None):
+def format_search_results(query: str, results: List[str], query_index: int = None):
     """Format search results for display."""
     output = []
     if query_index is not None:
@@ -67,20 +121,10 @@ def format_search_results(query: str, results: List, query_index: int = None):
     if not results:
         output.append("[検索結果が見つかりませんでした]")
     else:
-        for i, result in enumerate(results, 1):
-            # Agnoの検索結果の構造に応じて調整
-            if hasattr(result, "document") and hasattr(result.document, "content"):
-                content = result.document.content
-            elif hasattr(result, "content"):
-                content = result.content
-            elif isinstance(result, dict):
-                content = result.get("content", str(result))
-            else:
-                content = str(result)
-
+        for i, content in enumerate(results, 1):
             # 長すぎる場合は切り詰める
-            if len(content) > 200:
-                content = content[:200] + "..."
+            if len(content) > PREVIEW_CHARS:
+                content = content[:PREVIEW_CHARS] + "..."
 
             output.append(f"[Retrieved Document {i}]")
             output.append(content)
@@ -88,14 +132,39 @@ def format_search_results(query: str, results: List, query_index: int = None):
     return output
 
 
+def print_search_results(question: str, results: List[str]):
+    """Display the results for a single question."""
+    logger.info("---")
+    for line in format_search_results(question, results):
+        logger.info(line)
+
+
 def query_single_question(vector_db: PgVector, question: str):
     """Process a single question and display results."""
-    print("---")
     results = perform_search(vector_db, question)
-    formatted_output = format_search_results(question, results)
+    print_search_results(question, results)
+    flush_logger(logger)
+
 
-    for line in formatted_output:
-        print(line)
+async def aquery_questions(vector_db: PgVector, questions: Iterable[str]) -> int:
+    """Search questions concurrently as they are read and print results in order."""
+    pending: Deque[Tuple[str, asyncio.Task]] = deque()
+    count = 0
+    for question in questions:
+        # 同時実行数の上限に達したら、最も古い質問の結果を待って表示する
+        if len(pending) >= MAX_CONCURRENT_QUERIES:
+            oldest, task = pending.popleft()
+            print_search_results(oldest, await task)
+        task = asyncio.create_task(
+            asyncio.to_thread(perform_search, vector_db, question)
+        )
+        pending.append((question, task))
+        count += 1
+
+    while pending:
+        oldest, task = pending.popleft()
+        print_search_results(oldest, await task)
+    return count
 
 
 def query_from_csv(vector_db: PgVector, csv_file: str):
@@ -103,29 +172,54 @@ def query_from_csv(vector_db: PgVector, csv_file: str):
     print(f"===== Executing query from: {csv_file} =====")
     print()
 
-    questions = read_questions_from_csv(csv_file)
+    count = asyncio.run(aquery_questions(vector_db, iter_questions(csv_file)))
+    # 全質問の結果をまとめて出力してからサマリーを表示する
+    flush_logger(logger)
 
-    if not questions:
+    if not count:
         print("質問が見つかりませんでした。")
         return
 
-    for question in questions:
-        if question:  # 空の質問をスキップ
-            query_single_question(vector_db, question)
-            time.sleep(5)
-
     print("---")
-    print(f"\n処理完了: {len(questions)} 件の質問を処理しました。")
+    print(f"\n処理完了: {count} 件の質問を処理しました。")
 
 
-def interactive_query_mode(vector_db: PgVector):
-    """Interactive query mode for manual queries."""
+def warm_up_connections(vector_db: PgVector):
+    """Open the Gemini and database connections ahead of the next query."""
+    try:
+        if isinstance(vector_db.embedder, BatchingGeminiEmbedder):
+            vector_db.embedder.warm_up()
+        with vector_db.Session() as sess:
+            sess.execute(text("SELECT 1"))
+    except Exception:
+        # 事前接続に失敗しても検索時に改めて接続するので無視する
+        pass
+
+
+async def warm_up_when_idle(vector_db: PgVector):
+    """Warm up connections once the prompt has been idle for a while."""
+    await asyncio.sleep(WARM_UP_IDLE_SECONDS)
+    await asyncio.to_thread(warm_up_connections, vector_db)
+
+
+async def ainteractive_query_mode(vector_db: PgVector):
+    """Interactive query mode that warms up connections while the user types."""
     print("インタラクティブクエリモード (終了するには 'quit' または 'exit' を入力)")
     print("=" * 50)
 
+    session: PromptSession[str] = PromptSession()
+    # 起動時に一度だけ接続を温めておく（タスクの参照を保持する）
+    startup = asyncio.create_task(asyncio.to_thread(warm_up_connections, vector_db))
+
     while True:
         try:
-            query = input("\n質問を入力してください: ").strip()
+            # 直前の検索で接続は温まっているので、しばらく入力がない場合だけ温め直す
+            idle = asyncio.create_task(warm_up_when_idle(vector_db))
+            try:
+                query = await session.prompt_async("\n質問を入力してください: ")
+            finally:
+                idle.cancel()
+            query = query.strip()
 
             if query.lower() in ["quit", "exit", "q"]:
                 print("終了します。")
@@ -136,7 +230,10 @@ def interactive_query_mode(vector_db: PgVector):
                 continue
 
             print("\n検索中...")
-            results = perform_search(vector_db, query)
+            # 対話モードでは速度より検索精度を優先する
+            results = await asyncio.to_thread(
+                perform_search, vector_db, query, ef_search=RECALL_EF_SEARCH
+            )
             formatted_output = format_search_results(query, results)
 
             print("\n" + "=" * 50)
@@ -144,20 +241,24 @@ def interactive_query_mode(vector_db: PgVector):
                 print(line)
             print("=" * 50)
 
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError):
             print("\n\n終了します。")
             break
         except Exception as e:
             print(f"エラーが発生しました: {e}")
 
+    await startup
+
+
+def interactive_query_mode(vector_db: PgVector):
+    """Interactive query mode for manual queries."""
+    asyncio.run(ainteractive_query_mode(vector_db))
+
 
 def get_database_stats(vector_db: PgVector):
     """Get basic statistics about the database."""
     try:
-        # 全てのドキュメントを取得してカウント（大まかな方法）
-        all_results = vector_db.search("", limit=10000)  # 空クエリで全てを取得
-        total_count = len(all_results)
-        return total_count
+        return count_documents(vector_db)
     except Exception as e:
         print(f"統計情報取得エラー: {e}")
         return 0
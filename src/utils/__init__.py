@@ -0,0 +1 @@
+"""Shared helpers for the ingest and query scripts."""
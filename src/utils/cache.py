@@ -0,0 +1,105 @@
+"""
+Semantic cache for Agno Vector DB queries.
+Reuses search results for questions whose embeddings are nearly identical.
+"""
+
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+try:
+    import simsimd
+except ImportError:
+    simsimd = None  # type: ignore[assignment]
+
+
+def quantize(embedding: List[float]) -> Optional[np.ndarray]:
+    """Scale an embedding so its largest component is ±127 and store it as int8."""
+    vector = np.asarray(embedding, dtype=np.float32)
+    peak = np.abs(vector).max(initial=0.0)
+    if peak == 0:
+        return None
+    # Cosine similarity ignores the per-vector scale, so it need not be kept
+    return np.rint(vector * (127.0 / peak)).astype(np.int8)
+
+
+def cosine_similarities(
+    query: np.ndarray, vectors: np.ndarray, norms: np.ndarray
+) -> np.ndarray:
+    """Cosine similarity of an int8 query against every int8 row of vectors."""
+    if simsimd is not None:
+        distances = simsimd.cdist(query[np.newaxis, :], vectors, metric="cosine")
+        return 1.0 - np.asarray(distances)[0]
+    # Without SimSIMD, widen to int32 so the dot products cannot overflow
+    dots = vectors.astype(np.int32) @ query.astype(np.int32)
+    return dots / (norms * np.linalg.norm(query.astype(np.float32)))
+
+
+def _grow(array: np.ndarray, capacity: int) -> np.ndarray:
+    """Copy array into a new array with room for `capacity` rows."""
+    grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+class SemanticCache:
+    """In-memory cache of search results keyed by cosine similarity of queries."""
+
+    def __init__(self, threshold: float = 0.95):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        # Parallel arrays, one row per cached query, grown by doubling;
+        # rows [0, _size) are valid
+        # int8 query embeddings; the width is set by the first cached query
+        self._vectors = np.empty((0, 0), dtype=np.int8)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._limits = np.empty(0, dtype=np.int32)
+        # Entry i's result contents are _contents[_offsets[i] : _offsets[i + 1]]
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._contents: List[str] = []
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def lookup(self, embedding: List[float], limit: int) -> Optional[List[str]]:
+        """Return cached result contents for a similar query, or None on a miss."""
+        query = quantize(embedding)
+        if query is None:
+            return None
+        with self._lock:
+            if self._size == 0 or self._vectors.shape[1] != query.shape[0]:
+                return None
+            scores = cosine_similarities(
+                query, self._vectors[: self._size], self._norms[: self._size]
+            )
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold and self._limits[best] >= limit:
+                start = int(self._offsets[best])
+                end = min(int(self._offsets[best + 1]), start + limit)
+                return self._contents[start:end]
+        return None
+
+    def add(self, embedding: List[float], limit: int, contents: List[str]) -> None:
+        """Cache the result contents of a query."""
+        vector = quantize(embedding)
+        if vector is None:
+            return
+        with self._lock:
+            if self._size == 0:
+                self._vectors = np.empty((0, vector.shape[0]), dtype=np.int8)
+            elif self._vectors.shape[1] != vector.shape[0]:
+                return
+            if self._size == len(self._vectors):
+                capacity = max(16, self._size * 2)
+                self._vectors = _grow(self._vectors, capacity)
+                self._norms = _grow(self._norms, capacity)
+                self._limits = _grow(self._limits, capacity)
+                self._offsets = _grow(self._offsets, capacity + 1)
+            self._vectors[self._size] = vector
+            self._norms[self._size] = np.linalg.norm(vector.astype(np.float32))
+            self._limits[self._size] = limit
+            self._contents.extend(contents)
+            self._offsets[self._size + 1] = len(self._contents)
+            self._size += 1
@@ -0,0 +1,169 @@
+"""
+Chunking helpers for Agno Vector DB.
+Splits text into chunks where the topic shifts between adjacent sentences.
+"""
+
+import re
+from typing import List
+
+import numpy as np
+from agno.document.base import Document
+from agno.document.chunking.strategy import ChunkingStrategy
+
+from utils.embedder import BatchingGeminiEmbedder
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None  # type: ignore[assignment]
+
+# Split after Japanese sentence-ending punctuation, or after English
+# punctuation followed by whitespace (so "2.1" and "3.14" stay intact)
+SENTENCE_END = re.compile(r"(?<=[。．！？])|(?<=[.!?])\s+")
+# Heading and list numbers such as "1." or "2.1", kept with the text after them
+SECTION_NUMBER = re.compile(r"\d+(?:\.\d+)*\.?")
+# Japanese text is written without spaces between sentences
+CJK_CHAR = re.compile(r"[\u3000-\u30ff\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+if njit is not None:
+
+    # Not parallel=True: files are already chunked on several ingest threads,
+    # and Numba's default workqueue layer hangs at exit when its parallel
+    # kernels are launched from threads other than the main one
+    @njit(fastmath=True, cache=True)
+    def adjacent_similarities(embeddings: np.ndarray) -> np.ndarray:
+        """Dot product of each unit-length row with the row before it."""
+        n, dim = embeddings.shape
+        similarities = np.empty(max(n - 1, 0), dtype=np.float32)
+        for i in range(1, n):
+            total = np.float32(0.0)
+            for j in range(dim):
+                total += embeddings[i - 1, j] * embeddings[i, j]
+            similarities[i - 1] = total
+        return similarities
+
+else:
+
+    def adjacent_similarities(embeddings: np.ndarray) -> np.ndarray:
+        """Dot product of each unit-length row with the row before it."""
+        return np.einsum("ij,ij->i", embeddings[:-1], embeddings[1:])
+
+
+def split_sentences(line: str) -> List[str]:
+    """Split one line of text into sentences."""
+    sentences: List[str] = []
+    prefix = ""
+    for piece in SENTENCE_END.split(line):
+        piece = piece.strip()
+        if not piece:
+            continue
+        if SECTION_NUMBER.fullmatch(piece):
+            prefix += piece + " "
+            continue
+        sentences.append(prefix + piece)
+        prefix = ""
+    if prefix:
+        sentences.append(prefix.strip())
+    return sentences
+
+
+def split_long(sentence: str, size: int) -> List[str]:
+    """Split sentence into pieces of at most size characters, preferring spaces."""
+    pieces: List[str] = []
+    while len(sentence) > size:
+        cut = sentence.rfind(" ", 1, size + 1)
+        if cut <= 0:
+            cut = size
+        pieces.append(sentence[:cut].rstrip())
+        sentence = sentence[cut:].lstrip()
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+def join_sentences(left: str, right: str) -> str:
+    """Join two pieces of text, with a space only between non-Japanese text."""
+    if not left:
+        return right
+    if CJK_CHAR.match(left[-1]):
+        return left + right
+    return left + " " + right
+
+
+def find_breaks(embeddings: np.ndarray, threshold: float) -> np.ndarray:
+    """Indices of sentences that start a new topic (similarity below threshold)."""
+    return np.flatnonzero(adjacent_similarities(embeddings) < threshold) + 1
+
+
+class SentenceBoundaryChunking(ChunkingStrategy):
+    """Chunking strategy that breaks text where adjacent sentences diverge"""
+
+    def __init__(
+        self,
+        embedder: BatchingGeminiEmbedder,
+        chunk_size: int = 1000,
+        similarity_threshold: float = 0.5,
+    ):
+        self.embedder = embedder
+        self.chunk_size = chunk_size
+        self.similarity_threshold = similarity_threshold
+
+    def _sentence_embeddings(self, sentences: List[str]) -> np.ndarray:
+        """Embed all sentences in batches and normalize them to unit length."""
+        embeddings = np.asarray(
+            self.embedder.get_embeddings_batch(sentences), dtype=np.float32
+        )
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms > 0, norms, 1.0)
+
+    def chunk(self, document: Document) -> List[Document]:
+        """Split document into chunks at topic shifts, capped at chunk_size characters"""
+        if not document.content:
+            return [document]
+
+        # 見出しが前の文に連結されないよう、改行で分けてから整形する
+        # chunk_sizeを超える文（句点のない長い行など）はさらに分割する
+        sentences = [
+            piece
+            for line in document.content.splitlines()
+            for sentence in split_sentences(self.clean_text(line))
+            for piece in split_long(sentence, self.chunk_size)
+        ]
+        if not sentences or (
+            len(sentences) == 1 and len(document.content) <= self.chunk_size
+        ):
+            return [document]
+
+        breaks = set(
+            find_breaks(
+                self._sentence_embeddings(sentences), self.similarity_threshold
+            ).tolist()
+        )
+
+        chunks: List[str] = []
+        current = ""
+        for i, sentence in enumerate(sentences):
+            joined = join_sentences(current, sentence)
+            if current and (i in breaks or len(joined) > self.chunk_size):
+                chunks.append(current)
+                current = sentence
+            else:
+                current = joined
+        chunks.append(current)
+
+        # Convert chunks to Documents
+        chunked_documents: List[Document] = []
+        for i, chunk in enumerate(chunks, 1):
+            meta_data = document.meta_data.copy()
+            meta_data["chunk"] = i
+            chunk_id = f"{document.id}_{i}" if document.id else None
+            meta_data["chunk_size"] = len(chunk)
+
+            chunked_documents.append(
+                Document(
+                    id=chunk_id, name=document.name, meta_data=meta_data, content=chunk
+                )
+            )
+
+        return chunked_documents
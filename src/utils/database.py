@@ -0,0 +1,314 @@
+"""
+Database helpers for Agno Vector DB.
+Runs SQL directly against the pgvector table behind a PgVector instance.
+"""
+
+import json
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import psycopg
+from agno.document import Document
+from agno.utils.string import safe_content_hash
+from agno.vectordb.distance import Distance
+from agno.vectordb.pgvector import PgVector
+from psycopg import sql
+from sqlalchemy import (
+    ColumnElement,
+    Engine,
+    create_engine,
+    func,
+    make_url,
+    select,
+    text,
+)
+
+from utils.log import get_logger
+
+# Connections kept open in the pool, and the most it may hold at once
+POOL_SIZE = 4
+MAX_POOL_SIZE = 16
+
+# Columns written by copy_upsert_documents, in COPY order
+COPY_COLUMNS = [
+    "id",
+    "name",
+    "meta_data",
+    "filters",
+    "content",
+    "embedding",
+    "usage",
+    "content_hash",
+]
+
+# Settings applied (SET LOCAL) to bulk-load transactions. Checkpoint and WAL
+# settings are server-wide and cannot be changed from a session.
+BULK_LOAD_SETTINGS = {
+    "maintenance_work_mem": "2GB",
+    "max_parallel_maintenance_workers": "7",
+    "synchronous_commit": "off",
+}
+
+# Above this many (estimated) rows, trust the planner statistics instead of
+# running a full-table COUNT(*).
+EXACT_COUNT_THRESHOLD = 1_000_000
+
+logger = get_logger(__name__)
+
+
+def create_db_engine(db_url: str) -> Engine:
+    """Create a pooled SQLAlchemy engine that uses the psycopg 3 driver."""
+    url = make_url(db_url).set(drivername="postgresql+psycopg")
+    return create_engine(
+        url,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_POOL_SIZE - POOL_SIZE,
+        pool_pre_ping=True,
+    )
+
+
+def estimate_document_count(vector_db: PgVector) -> Optional[int]:
+    """Return the planner's row estimate for the table.
+
+    The estimate is -1 if the table was never analyzed, and None if the
+    table does not exist.
+    """
+    with vector_db.Session() as sess, sess.begin():
+        result = sess.execute(
+            text(
+                "SELECT reltuples::bigint FROM pg_class "
+                "WHERE oid = to_regclass(:name)"
+            ),
+            {"name": vector_db.table.fullname},
+        ).scalar()
+    return int(result) if result is not None else None
+
+
+def count_documents(vector_db: PgVector) -> int:
+    """Count rows in the table without pulling any of them to the client."""
+    estimate = estimate_document_count(vector_db)
+    if estimate is None:
+        return 0
+    if estimate >= EXACT_COUNT_THRESHOLD:
+        return estimate
+
+    with vector_db.Session() as sess, sess.begin():
+        stmt = select(func.count()).select_from(vector_db.table)
+        return int(sess.execute(stmt).scalar() or 0)
+
+
+def search_by_embedding(
+    vector_db: PgVector,
+    embedding: List[float],
+    limit: int = 5,
+    preview_chars: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> List[Document]:
+    """Vector search with a precomputed query embedding.
+
+    If preview_chars is set, only that many leading characters of each
+    document's content are fetched from the database. If ef_search is set,
+    it overrides hnsw.ef_search for this search only (raised to at least
+    limit, since HNSW never returns more than ef_search rows).
+    """
+    column = vector_db.table.c.embedding
+    distance = {
+        Distance.l2: column.l2_distance,
+        Distance.max_inner_product: column.max_inner_product,
+    }.get(vector_db.distance, column.cosine_distance)
+    content_col: ColumnElement[str] = vector_db.table.c.content
+    if preview_chars is not None:
+        content_col = func.substr(content_col, 1, preview_chars).label("content")
+    stmt = (
+        select(
+            vector_db.table.c.id,
+            vector_db.table.c.name,
+            vector_db.table.c.meta_data,
+            content_col,
+        )
+        .order_by(distance(embedding))
+        .limit(limit)
+    )
+    with vector_db.Session() as sess, sess.begin():
+        if ef_search is not None:
+            # SET LOCAL equivalent; the setting ends with this transaction
+            sess.execute(
+                text("SELECT set_config('hnsw.ef_search', :ef, true)"),
+                {"ef": str(max(ef_search, limit))},
+            )
+        rows = sess.execute(stmt).fetchall()
+    return [
+        Document(id=row.id, name=row.name, meta_data=row.meta_data, content=row.content)
+        for row in rows
+    ]
+
+
+def _meta_table(vector_db: PgVector) -> str:
+    """Fully qualified name of the table recording ingested file hashes."""
+    return f'"{vector_db.schema}"."{vector_db.table_name}_meta"'
+
+
+def get_ingested_hash(vector_db: PgVector, path: str) -> Optional[str]:
+    """Return the SHA-256 recorded when path was last ingested, if any."""
+    with vector_db.Session() as sess, sess.begin():
+        exists = sess.execute(
+            text("SELECT to_regclass(:name)"), {"name": _meta_table(vector_db)}
+        ).scalar()
+        if exists is None:
+            return None
+        return sess.execute(
+            text(f"SELECT sha256 FROM {_meta_table(vector_db)} WHERE path = :path"),
+            {"path": path},
+        ).scalar()
+
+
+def record_ingested_hash(vector_db: PgVector, path: str, sha256: str) -> None:
+    """Record the SHA-256 of a file that was ingested successfully."""
+    with vector_db.Session() as sess, sess.begin():
+        sess.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {_meta_table(vector_db)} ("
+                "path TEXT PRIMARY KEY, "
+                "sha256 TEXT NOT NULL, "
+                "updated_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            )
+        )
+        sess.execute(
+            text(
+                f"INSERT INTO {_meta_table(vector_db)} (path, sha256) "
+                "VALUES (:path, :sha256) "
+                "ON CONFLICT (path) DO UPDATE "
+                "SET sha256 = EXCLUDED.sha256, updated_at = now()"
+            ),
+            {"path": path, "sha256": sha256},
+        )
+
+
+def clear_ingested_hashes(vector_db: PgVector) -> None:
+    """Forget all ingested file hashes so every file is loaded again."""
+    with vector_db.Session() as sess, sess.begin():
+        sess.execute(text(f"DROP TABLE IF EXISTS {_meta_table(vector_db)}"))
+
+
+@contextmanager
+def connect(vector_db: PgVector) -> Iterator[psycopg.Connection]:
+    """Check out a psycopg connection from the PgVector engine's pool.
+
+    The engine must come from create_db_engine(), which always uses psycopg 3.
+    """
+    pooled = vector_db.db_engine.raw_connection()
+    try:
+        conn = pooled.driver_connection
+        if not isinstance(conn, psycopg.Connection):
+            raise TypeError(
+                "PgVector engine must use the psycopg 3 driver; "
+                "create it with create_db_engine()"
+            )
+        yield conn
+    finally:
+        pooled.close()
+
+
+@contextmanager
+def bulk_load_transaction(vector_db: PgVector) -> Iterator[psycopg.Connection]:
+    """Open a transaction tuned for bulk loads; the settings end with it."""
+    with connect(vector_db) as conn, conn.transaction():
+        for name, value in BULK_LOAD_SETTINGS.items():
+            conn.execute("SELECT set_config(%s, %s, true)", (name, value))
+        yield conn
+
+
+def _to_vector_literal(embedding: List[float]) -> str:
+    """Serialize an embedding in pgvector's text format."""
+    return "[" + ",".join(map(str, embedding)) + "]"
+
+
+def copy_upsert_documents(vector_db: PgVector, documents: List[Document]) -> int:
+    """Upsert documents by COPYing them into a staging table and merging once."""
+    rows = []
+    for doc in documents:
+        doc.embed(embedder=vector_db.embedder)
+        if not doc.embedding:
+            raise ValueError(
+                f"No embedding was returned for document {doc.name!r} "
+                f"(id={doc.id!r}); it cannot be written to the vector column"
+            )
+        meta_data = json.dumps(doc.meta_data or {})
+        rows.append(
+            (
+                safe_content_hash(doc.content),
+                doc.name,
+                meta_data,
+                meta_data,
+                doc.content.replace("\x00", "\ufffd"),
+                _to_vector_literal(doc.embedding),
+                json.dumps(doc.usage) if doc.usage is not None else None,
+                safe_content_hash(doc.content),
+            )
+        )
+    if not rows:
+        return 0
+
+    table = sql.Identifier(vector_db.schema, vector_db.table_name)
+    staging = sql.Identifier(f"{vector_db.table_name}_staging")
+    columns = sql.SQL(", ").join(map(sql.Identifier, COPY_COLUMNS))
+    updates = sql.SQL(", ").join(
+        sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(c))
+        for c in COPY_COLUMNS
+        if c != "id"
+    )
+
+    with bulk_load_transaction(vector_db) as conn, conn.cursor() as cur:
+        cur.execute(
+            sql.SQL(
+                "CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP"
+            ).format(staging, table)
+        )
+        with cur.copy(
+            sql.SQL("COPY {} ({}) FROM STDIN").format(staging, columns)
+        ) as copy:
+            for row in rows:
+                copy.write_row(row)
+        # DISTINCT ON keeps a duplicated chunk from hitting the same row twice
+        cur.execute(
+            sql.SQL(
+                "INSERT INTO {table} ({columns}) "
+                "SELECT DISTINCT ON (id) {columns} FROM {staging} "
+                "ON CONFLICT (id) DO UPDATE SET {updates}, updated_at = now()"
+            ).format(table=table, columns=columns, staging=staging, updates=updates)
+        )
+    return len(rows)
+
+
+@contextmanager
+def deferred_vector_index(vector_db: PgVector) -> Iterator[None]:
+    """Drop the vector indexes during a bulk load and rebuild them afterwards.
+
+    Rebuilding costs time proportional to the whole table, so this only pays
+    off when the load adds a large share of its rows. A failed rebuild is
+    logged rather than raised so the load results are still reported.
+    """
+    with connect(vector_db) as conn, conn.transaction():
+        indexes = conn.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE schemaname = %s AND tablename = %s "
+            "AND indexdef ~ 'USING (hnsw|ivfflat)'",
+            (vector_db.schema, vector_db.table_name),
+        ).fetchall()
+        for name, _ in indexes:
+            conn.execute(
+                sql.SQL("DROP INDEX IF EXISTS {}").format(
+                    sql.Identifier(vector_db.schema, name)
+                )
+            )
+
+    try:
+        yield
+    finally:
+        for _, definition in indexes:
+            try:
+                with bulk_load_transaction(vector_db) as conn:
+                    conn.execute(definition)
+            except Exception as e:
+                logger.error("ベクトルインデックスの再作成に失敗しました: %s", e)
+                logger.error("手動で実行してください: %s", definition)
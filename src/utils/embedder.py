@@ -0,0 +1,123 @@
+"""
+Embedder helpers for Agno Vector DB.
+Wraps GeminiEmbedder so that many texts are embedded in a single API call.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from agno.embedder.google import GeminiEmbedder
+from google.genai.errors import ClientError
+from google.genai.types import EmbedContentResponse
+
+from utils.ratelimit import RateLimiter, backoff_delay
+
+
+@dataclass
+class BatchingGeminiEmbedder(GeminiEmbedder):
+    """GeminiEmbedder that embeds texts in batches and serves them from a buffer."""
+
+    # Gemini accepts at most 100 contents per embed_content request
+    batch_size: int = 100
+    # Retries after a 429 (quota exceeded) response before giving up
+    max_retries: int = 5
+    rate_limiter: RateLimiter = field(
+        default_factory=lambda: RateLimiter(rpm=int(getenv("GEMINI_RPM", "1500"))),
+        repr=False,
+    )
+    _buffer: Dict[str, List[float]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    # Number of prefetch() callers still using each buffered text, so loaders
+    # sharing a chunk text do not discard each other's embeddings
+    _refs: Dict[str, int] = field(default_factory=dict, init=False, repr=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def _response(self, text: str) -> EmbedContentResponse:
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                return super()._response(text)
+            except ClientError as e:
+                # Only back off on quota errors; anything else is a real failure
+                if e.code != 429 or attempt >= self.max_retries:
+                    raise
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+
+    def warm_up(self) -> None:
+        """Open the HTTPS connection to Gemini with a lightweight metadata request."""
+        self.rate_limiter.acquire()
+        self.client.models.get(model=self.id)
+
+    def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with one API call per batch_size texts, keeping input order."""
+        embeddings: List[List[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i : i + self.batch_size]
+            response = self._response(text=batch)  # type: ignore[arg-type]
+            for embedding in response.embeddings or []:
+                embeddings.append(embedding.values or [])
+        if len(embeddings) != len(texts):
+            raise ValueError(
+                f"Expected {len(texts)} embeddings from Gemini, got {len(embeddings)}"
+            )
+        return embeddings
+
+    def prefetch(self, texts: Iterable[str]) -> None:
+        """Embed texts ahead of time so later get_embedding calls skip the API.
+
+        Every prefetch() must be paired with a discard() of the same texts.
+        """
+        unique = [t for t in dict.fromkeys(texts) if t]
+        with self._lock:
+            for text in unique:
+                self._refs[text] = self._refs.get(text, 0) + 1
+            pending = [t for t in unique if t not in self._buffer]
+        if not pending:
+            return
+        embeddings = self.get_embeddings_batch(pending)
+        with self._lock:
+            for text, embedding in zip(pending, embeddings):
+                if text in self._refs:
+                    self._buffer[text] = embedding
+
+    def discard(self, texts: Iterable[str]) -> None:
+        """Release prefetched embeddings once no caller needs them any more."""
+        with self._lock:
+            for text in dict.fromkeys(texts):
+                count = self._refs.get(text, 0) - 1
+                if count > 0:
+                    self._refs[text] = count
+                else:
+                    self._refs.pop(text, None)
+                    self._buffer.pop(text, None)
+
+    def get_embedding(self, text: str) -> List[float]:
+        embedding = self._buffer.get(text)
+        if embedding is not None:
+            return embedding
+        return super().get_embedding(text)
+
+    def get_embedding_and_usage(self, text: str) -> Tuple[List[float], Optional[Dict]]:
+        embedding = self._buffer.get(text)
+        if embedding is not None:
+            return embedding, None
+        return super().get_embedding_and_usage(text)
+
+
+_EMBEDDER: Optional[BatchingGeminiEmbedder] = None
+
+
+def get_embedder() -> BatchingGeminiEmbedder:
+    """Return the process-wide embedder, creating it on first use."""
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        _EMBEDDER = BatchingGeminiEmbedder()
+    return _EMBEDDER
@@ -0,0 +1,34 @@
+"""
+Logging helpers for Agno Vector DB.
+Buffers progress messages in memory and writes them to stdout in batches.
+"""
+
+import logging
+import sys
+from logging.handlers import MemoryHandler
+
+# Buffered records are written once this many have accumulated
+BUFFER_CAPACITY = 1000
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return a logger that buffers INFO records and flushes on WARNING or above."""
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(
+            MemoryHandler(
+                capacity=BUFFER_CAPACITY, flushLevel=logging.WARNING, target=stream
+            )
+        )
+        logger.setLevel(logging.INFO)
+        # Keep records out of the root logger so they are not printed twice
+        logger.propagate = False
+    return logger
+
+
+def flush_logger(logger: logging.Logger) -> None:
+    """Write out any buffered records, e.g. before printing a summary."""
+    for handler in logger.handlers:
+        handler.flush()
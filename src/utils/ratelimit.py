@@ -0,0 +1,42 @@
+"""
+Rate limiting helpers for Agno Vector DB.
+Keeps Gemini API calls under the per-minute quota instead of sleeping blindly.
+"""
+
+import random
+import threading
+import time
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rpm` calls per minute."""
+
+    def __init__(self, rpm: int = 1500):
+        self.rate = rpm / 60.0
+        # Allow up to one second worth of calls in a burst
+        self.capacity = max(self.rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        """Block until a call is allowed."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with jitter for the given retry attempt (0-based)."""
+    return min(cap, base * 2**attempt) * random.uniform(0.5, 1.0)
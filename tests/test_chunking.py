@@ -0,0 +1,68 @@
+"""Tests for SentenceBoundaryChunking on the bundled sample text."""
+
+from pathlib import Path
+from typing import List
+
+from agno.document.base import Document
+
+from utils.chunking import SECTION_NUMBER, SentenceBoundaryChunking, split_sentences
+
+SAMPLE_TEXT = Path(__file__).resolve().parent.parent / "data" / "sample.txt"
+
+
+class ConstantEmbedder:
+    """Embeds every text as the same vector, so no topic breaks are found."""
+
+    def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        return [[1.0, 0.0, 0.0] for _ in texts]
+
+
+def chunk_sample(chunk_size: int = 200) -> List[str]:
+    chunking = SentenceBoundaryChunking(
+        embedder=ConstantEmbedder(), chunk_size=chunk_size  # type: ignore[arg-type]
+    )
+    document = Document(id="sample", name="sample", content=SAMPLE_TEXT.read_text())
+    return [chunk.content for chunk in chunking.chunk(document)]
+
+
+def test_section_numbers_stay_with_their_headings():
+    sentences = [
+        sentence
+        for line in SAMPLE_TEXT.read_text().splitlines()
+        for sentence in split_sentences(line)
+    ]
+    assert "2.1 Function Point Method" in sentences
+    assert "1. Overview" in sentences
+    assert not [s for s in sentences if SECTION_NUMBER.fullmatch(s)]
+
+
+def test_sample_chunks_are_not_fragments():
+    chunks = chunk_sample()
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert not [chunk for chunk in chunks if len(chunk) < 20]
+    assert any("Function Point Method" in chunk for chunk in chunks)
+
+
+def test_japanese_sentences_are_joined_without_spaces():
+    chunking = SentenceBoundaryChunking(
+        embedder=ConstantEmbedder(), chunk_size=1000  # type: ignore[arg-type]
+    )
+    document = Document(
+        content="見積もりは重要です。\n過去の実績を使います！精度が上がります。"
+    )
+    [chunk] = chunking.chunk(document)
+    assert (
+        chunk.content == "見積もりは重要です。過去の実績を使います！精度が上がります。"
+    )
+
+
+def test_long_sentences_are_split_to_chunk_size():
+    chunking = SentenceBoundaryChunking(
+        embedder=ConstantEmbedder(), chunk_size=100  # type: ignore[arg-type]
+    )
+    for content in ["a" * 5000, "Short. " + "b" * 3000 + ". End.", "word " * 1000]:
+        chunks = [c.content for c in chunking.chunk(Document(content=content))]
+        assert len(chunks) > 1
+        assert all(0 < len(chunk) <= 100 for chunk in chunks)
+        assert "".join(chunks).replace(" ", "") == content.replace(" ", "")
@@ -0,0 +1,64 @@
+"""Tests for ingest_files skipping and recording file hashes."""
+
+from typing import List
+from unittest.mock import MagicMock
+
+import pytest
+from agno.vectordb.pgvector import PgVector
+
+import ingest
+
+
+class ConstantEmbedder:
+    """Embeds every text as the same vector."""
+
+    def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        return [[1.0, 0.0, 0.0] for _ in texts]
+
+
+class FailingEmbedder:
+    """Fails like Gemini does once its 429 retries run out."""
+
+    def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        raise RuntimeError("429 RESOURCE_EXHAUSTED")
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    """Stub out the database and collect the hashes ingest_files records."""
+    hashes: List[str] = []
+    monkeypatch.setattr(ingest, "get_ingested_hash", lambda db, path: None)
+    monkeypatch.setattr(
+        ingest, "record_ingested_hash", lambda db, path, sha256: hashes.append(path)
+    )
+    monkeypatch.setattr(
+        ingest, "copy_upsert_documents", lambda db, documents: len(documents)
+    )
+    return hashes
+
+
+def vector_db() -> PgVector:
+    db = MagicMock(spec=PgVector)
+    db.exists.return_value = True
+    db.embedder = ConstantEmbedder()
+    return db
+
+
+def test_failed_text_file_is_not_recorded(tmp_path, monkeypatch, recorded):
+    monkeypatch.setattr(ingest, "get_embedder", FailingEmbedder)
+    path = tmp_path / "doc.txt"
+    path.write_text("First sentence. Second sentence.")
+
+    jobs = [(ingest.load_text_knowledge, str(path))]
+    assert ingest.ingest_files(vector_db(), jobs) == 0
+    assert recorded == []
+
+
+def test_loaded_text_file_is_recorded(tmp_path, monkeypatch, recorded):
+    monkeypatch.setattr(ingest, "get_embedder", ConstantEmbedder)
+    path = tmp_path / "doc.txt"
+    path.write_text("First sentence. Second sentence.")
+
+    jobs = [(ingest.load_text_knowledge, str(path))]
+    assert ingest.ingest_files(vector_db(), jobs) == 1
+    assert recorded == [str(path.resolve())]